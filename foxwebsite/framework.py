@@ -1,18 +1,30 @@
 import os
 import re
-import json
+import stat
+import base64
 import hmac
-import hashlib
 import asyncio
-import traceback
-from typing import Callable, Dict, Tuple, Optional, Any, List
-from urllib.parse import parse_qs
+import functools
+import logging
+import weakref
+from types import ModuleType
+from typing import Callable, Dict, Tuple, Optional, Any, List, Union
+from urllib.parse import parse_qsl
 from string import Template
 from contextvars import ContextVar
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import orjson
+except ImportError:  # 没有安装 orjson 时退回标准库 json
+    import json
+    orjson = None
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from jinja2 import Environment, FileSystemLoader, TemplateNotFound, TemplateSyntaxError
 import uvicorn
 
+log = logging.getLogger("micropy")
+
 # ======================
 # 上下文变量
 # ======================
@@ -21,25 +33,158 @@ _session_ctx = ContextVar("session", default=None)
 _app_ctx = ContextVar("app", default=None)
 
 # ======================
-# 工具函数
+# 常量
 # ======================
+_CT_MAP = {
+    ".css": "text/css", ".js": "application/javascript",
+    ".png": "image/png", ".jpg": "image/jpeg", ".ico": "image/x-icon",
+    ".html": "text/html", ".json": "application/json"
+}
+# 常用 content-type 预先构造好 ASGI header 元组
+_CT_HEADERS = {ct: (b"content-type", ct.encode()) for ct in (*_CT_MAP.values(), "application/octet-stream")}
+_H_CT_HTML = _CT_HEADERS["text/html"]
+_H_CT_JSON = _CT_HEADERS["application/json"]
+# 小响应的 content-length 直接查表，更大的用 b"%d" 格式化
+_CL_CACHE = tuple(b"%d" % i for i in range(4096))
+
+def _content_length(n: int) -> bytes:
+    return _CL_CACHE[n] if n < 4096 else b"%d" % n
+_DELETED_COOKIE = b"deleted; Path=/; Expires=Thu, 01 Jan 1970 00:00:00 GMT; HttpOnly"
+# errorhandler 查找缓存里表示“没有对应 handler”的哨兵
+_MISSING = object()
+
+# favicon.ico 的 204 响应头（元组不可变，消息本身每次新建）
+_FAVICON_CT = (b"content-type", b"image/x-icon")
+_CL_ZERO = (b"content-length", b"0")
+# 路由不存在时的 404 响应体和 content-length 头（消息本身每次新建）
+_404_BODY = b"<h1>404 The route does not exist.</h1>"
+_404_CL = (b"content-length", _content_length(len(_404_BODY)))
+# 默认 500 页面，只有异常信息部分是动态的
+_500_HEAD = b"<h1>500 Internal Server Error</h1><pre>"
+_500_TAIL = b"</pre>"
+_STATIC_CACHE_MAX_FILE_SIZE = 1 << 20  # 超过 1 MiB 的静态文件不进内存缓存
+_STATIC_CACHE_MAX_ENTRIES = 256
+_STATIC_CACHE_MAX_BYTES = 32 << 20  # 内存缓存的总字节上限
+_STATIC_CHUNK_SIZE = 256 << 10  # 大文件分块发送的块大小
+_COOKIE_RE = re.compile(rb"([^=;\s]+)=\s*([^;]*?)\s*(?:;|$)")
 
-def sign(data: str, secret: str) -> str:
-    return hmac.new(secret.encode(), data.encode(), hashlib.sha256).hexdigest()
+# ======================
+# 工具函数
+# ======================
 
-def serialize_session(data: dict, secret: str) -> str:
-    serialized = json.dumps(data, separators=(',', ':'), sort_keys=True)
-    sig = sign(serialized, secret)
-    return f"{serialized}.{sig}"
+def _stat_file(path: str) -> Optional[os.stat_result]:
+    """一次 stat 同时判断存在且为普通文件；否则返回 None"""
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError):  # 路径含 NUL 等非法字符时 os.stat 抛 ValueError
+        return None
+    return st if stat.S_ISREG(st.st_mode) else None
 
-def deserialize_session(value: str, secret: str) -> Optional[dict]:
-    if not isinstance(value, str) or "." not in value:
+def _static_file_path(path: str) -> Optional[str]:
+    """纯字符串检查，不访问文件系统：拒绝反斜杠、NUL 和任何 .. 路径段，返回相对当前目录的文件路径"""
+    if "\\" in path or "\x00" in path or "/../" in path or path.endswith("/.."):
         return None
-    data, sig = value.rsplit(".", 1)
-    if not hmac.compare_digest(sig, sign(data, secret)):
+    return "." + path
+
+def _parse_path(path: str) -> Tuple[List[str], str, str]:
+    """从左到右解析路由路径中的 {name} 占位符
+
+    返回 (parts, pattern, body)：parts 为 [字面量, 参数名, 字面量, ...]；
+    pattern 用命名分组，body 用无名分组（供合并正则使用）。占位符不合法时抛出 ValueError。
+    """
+    parts, pattern, body = [], [], []
+    i = 0
+    while True:
+        start = path.find("{", i)
+        literal = path[i:] if start == -1 else path[i:start]
+        parts.append(literal)
+        escaped = re.escape(literal)
+        pattern.append(escaped)
+        body.append(escaped)
+        if start == -1:
+            break
+        end = path.find("}", start + 1)
+        name = path[start + 1:end] if end != -1 else ""
+        if not name.isidentifier() or name in parts[1::2]:
+            raise ValueError(f"Invalid route placeholder in {path!r}")
+        parts.append(name)
+        pattern.append(f"(?P<{name}>[^/]+)")
+        body.append("([^/]+)")
+        i = end + 1
+    return parts, "".join(pattern), "".join(body)
+
+class _KeepMissing(dict):
+    """url_for 中未提供的参数保持 {name} 原样"""
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+def _url_template(path: str, parts: List[str]) -> Callable[[dict], str]:
+    """为 url_for 预先生成 values -> url 的函数
+
+    参数名已由 _parse_path 校验为合法标识符，可以直接用于 str.format_map。
+    """
+    if len(parts) == 1:
+        return lambda values: path
+    # 转义字面量中的花括号后交给 str.format_map，替换在 C 中完成
+    fmt = "".join(
+        f"{{{part}}}" if i % 2 else part.replace("{", "{{").replace("}", "}}")
+        for i, part in enumerate(parts)
+    )
+    return lambda values: fmt.format_map(_KeepMissing(values))
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+if orjson is not None:
+    def _dumps(obj) -> bytes:
+        """JSON 序列化，直接返回 UTF-8 bytes"""
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    def _dumps_sorted(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+
+    _loads = orjson.loads
+else:
+    # 预先构造好编码器，避免每次调用 json.dumps 都重新解析参数
+    _json_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    _json_encode_sorted = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode
+
+    def _dumps(obj) -> bytes:
+        """JSON 序列化，直接返回 UTF-8 bytes"""
+        return _json_encode(obj).encode("utf-8")
+
+    def _dumps_sorted(obj) -> bytes:
+        return _json_encode_sorted(obj).encode("utf-8")
+
+    _loads = json.loads
+
+def sign(data: bytes, secret: bytes) -> bytes:
+    # 一次性 HMAC：直接走 OpenSSL，不构造 hmac.HMAC 对象；返回 32 字节原始摘要
+    return hmac.digest(secret, data, "sha256")
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+def serialize_session(data: dict, secret: bytes) -> bytes:
+    """session -> base64url(json).base64url(hmac)"""
+    payload = _b64encode(_dumps_sorted(data))
+    return payload + b"." + _b64encode(sign(payload, secret))
+
+def deserialize_session(value: Union[str, bytes], secret: bytes) -> Optional[dict]:
+    if isinstance(value, str):
+        value = value.encode()
+    if not isinstance(value, bytes) or b"." not in value:
         return None
+    payload, sig = value.rsplit(b".", 1)
     try:
-        return json.loads(data)
+        # 先校验签名再解码 payload
+        if not hmac.compare_digest(_b64decode(sig), sign(payload, secret)):
+            return None
+        return _loads(_b64decode(payload))
     except:
         return None
 
@@ -47,65 +192,119 @@ def deserialize_session(value: str, secret: str) -> Optional[dict]:
 # 请求类
 # ======================
 
+class _TrackedDict(dict):
+    """session 字典：写操作会把 modified 置为 True，未修改时响应不再重写 cookie"""
+    __slots__ = ("modified",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.modified = False
+
+    def __setitem__(self, key, value):
+        self.modified = True
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.modified = True
+        super().__delitem__(key)
+
+    def __ior__(self, other):
+        self.modified = True
+        return super().__ior__(other)
+
+    def pop(self, *args):
+        self.modified = True
+        return super().pop(*args)
+
+    def popitem(self):
+        self.modified = True
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self.modified = True
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self.modified = True
+        super().update(*args, **kwargs)
+
+    def clear(self):
+        self.modified = True
+        super().clear()
+
 class Request:
-    def __init__(self, scope, receive):
+    __slots__ = ("scope", "method", "path", "_qp", "_body", "receive", "_cookies",
+                 "params", "_response_headers", "session", "app")
+
+    def __init__(self, scope, receive, app=None):
         self.scope = scope
         self.method = scope["method"]
         self.path = scope["path"]
-        self.query_params = parse_qs(scope.get("query_string", b"").decode())
+        self._qp = None
         self._body = None
         self.receive = receive
         self._cookies = None
         self.params = {}  # 路径参数
         self._response_headers = []
+        self.session: dict = _TrackedDict()  # MicroPy.__call__ 会用 cookie 中的数据填充
+        self.app = app  # 由 MicroPy.__call__ 传入
+
+    @property
+    def query_params(self):
+        """查询参数，首次访问时才解析；同名参数取最后一个值"""
+        if self._qp is None:
+            qs = self.scope.get("query_string", b"")
+            self._qp = dict(parse_qsl(qs.decode("latin-1"))) if qs else {}
+        return self._qp
 
     @property
     def cookies(self):
         if self._cookies is None:
             self._cookies = {}
-            for header in self.scope.get("headers", []):
-                if header[0].lower() == b"cookie":
-                    cookie_str = header[1].decode()
-                    for item in cookie_str.split(";"):
-                        if "=" in item:
-                            k, v = item.strip().split("=", 1)
-                            self._cookies[k] = v
+            # ASGI 规定 header 名已是小写 bytes
+            for name, value in self.scope.get("headers", []):
+                if name == b"cookie":
+                    for k, v in _COOKIE_RE.findall(value):
+                        self._cookies[k.decode()] = v.decode()
         return self._cookies
 
     async def body(self):
         if self._body is None:
-            body = b""
+            body = bytearray()  # 可变缓冲区，避免 bytes 拼接的重复拷贝
             more_body = True
             while more_body:
                 message = await self.receive()
-                body += message.get("body", b"")
+                chunk = message.get("body")
+                if chunk:
+                    body += chunk
                 more_body = message.get("more_body", False)
-            self._body = body
+            self._body = bytes(body)
         return self._body
 
     def clear_session(self):
         """清除 session 并设置删除 cookie 的响应头"""
-        if hasattr(self, "session") and isinstance(self.session, dict):
-            self.session.clear()
-        cookie_header = f"{self.app.session_cookie_name}=deleted; Path=/; Expires=Thu, 01 Jan 1970 00:00:00 GMT; HttpOnly"
-        self._response_headers.append((b"set-cookie", cookie_header.encode()))
+        self.session.clear()
+        self._response_headers.append((b"set-cookie", self.app._session_cookie_prefix + _DELETED_COOKIE))
 
     async def json(self):
         body = await self.body()
-        return json.loads(body.decode()) if body else None
+        return _loads(body) if body else None
 
 # ======================
 # 响应函数
 # ======================
 
-async def send_response(send, status: int, content: str, content_type: str = "text/html"):
-    content_bytes = content.encode("utf-8")
+def _ct_header(content_type: str) -> Tuple[bytes, bytes]:
+    return _CT_HEADERS.get(content_type) or (b"content-type", content_type.encode())
+
+async def send_response(send, status: int, content: Union[str, bytes], content_type: str = "text/html"):
+    content_bytes = content if isinstance(content, bytes) else content.encode("utf-8")
     await send({
         "type": "http.response.start",
         "status": status,
         "headers": [
-            (b"content-type", content_type.encode()),
-            (b"content-length", str(len(content_bytes)).encode())
+            _ct_header(content_type),
+            (b"content-length", _content_length(len(content_bytes)))
         ],
     })
     await send({
@@ -114,11 +313,36 @@ async def send_response(send, status: int, content: str, content_type: str = "te
     })
 
 async def send_json(send, data, status: int = 200):
-    content = json.dumps(data, ensure_ascii=False)
-    await send_response(send, status, content, "application/json")
+    await send_response(send, status, _dumps(data), "application/json")
+
+def _encode_str(response: str) -> Tuple[bytes, Tuple[bytes, bytes]]:
+    return response.encode("utf-8"), _H_CT_HTML
+
+def _encode_dict(response: dict) -> Tuple[bytes, Tuple[bytes, bytes]]:
+    return _dumps(response), _H_CT_JSON
+
+def _encode_bytes(response: bytes) -> Tuple[bytes, Tuple[bytes, bytes]]:
+    return response, _H_CT_HTML
+
+# 按返回值的确切类型查表，一次字典查找代替 isinstance 链
+_BODY_ENCODERS = {str: _encode_str, dict: _encode_dict, bytes: _encode_bytes}
+
+def _encode_body(response) -> Tuple[bytes, Tuple[bytes, bytes]]:
+    """把 handler 返回值编码为 (body, content-type header)"""
+    encoder = _BODY_ENCODERS.get(type(response))
+    if encoder is not None:
+        return encoder(response)
+    # 子类（如 Markup、OrderedDict）和其他类型
+    if isinstance(response, dict):
+        return _dumps(response), _H_CT_JSON
+    if isinstance(response, str):
+        return response.encode("utf-8"), _H_CT_HTML
+    if isinstance(response, bytes):
+        return response, _H_CT_HTML
+    return str(response).encode("utf-8"), _H_CT_HTML
 
 async def serve_file(send, file_path: str, content_type: str = "text/html"):
-    if os.path.exists(file_path) and os.path.isfile(file_path):
+    if _stat_file(file_path) is not None:
         with open(file_path, "r", encoding="utf-8") as f:
             content = f.read()
         await send_response(send, 200, content, content_type)
@@ -129,30 +353,82 @@ async def serve_file(send, file_path: str, content_type: str = "text/html"):
 # MicroPy 核心
 # ======================
 
+class _Config(dict):
+    """app.config：任何写入都会调用 on_change，让 app 同步由配置推导出的属性"""
+    __slots__ = ("_on_change",)
+
+    def __init__(self, on_change: Callable[[], None], *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._on_change = on_change
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._on_change()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._on_change()
+
+    def __ior__(self, other):
+        result = super().__ior__(other)
+        self._on_change()
+        return result
+
+    def pop(self, *args):
+        result = super().pop(*args)
+        self._on_change()
+        return result
+
+    def popitem(self):
+        result = super().popitem()
+        self._on_change()
+        return result
+
+    def setdefault(self, key, default=None):
+        result = super().setdefault(key, default)
+        self._on_change()
+        return result
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._on_change()
+
+    def clear(self):
+        super().clear()
+        self._on_change()
+
 class MicroPy:
     def __init__(self, template_folder="templates", static_url_path="/static", secret_key="dev-secret"):
         self.template_folder = template_folder
-        self.static_url_path = static_url_path
-        self.secret_key = secret_key
+        self.static_url_path = static_url_path  # 同时缓存带结尾 "/" 的前缀，见 static_url_path 属性
+        self.secret_key = secret_key  # 同时缓存 bytes 形式，见 secret_key 属性
         self.session_cookie_name = "micropy_session"
         self.session_serializer = URLSafeTimedSerializer(secret_key, salt="session")
         self.app = self  # 兼容 Flask 风格
         os.makedirs(template_folder, exist_ok=True)
 
         # 路由系统
-        self.routes: List[Tuple[re.Pattern, str, Callable]] = []
+        self.routes: List[Tuple[re.Pattern, str, Callable, bool]] = []
         self.route_map: Dict[str, str] = {}  # 用于 url_for
+        self._url_templates: Dict[str, Callable[[dict], str]] = {}  # endpoint -> 生成 url 的函数
+        self._static_routes: Dict[Tuple[str, str], Tuple[Callable, bool]] = {}  # (method, path) -> (handler, is_coro)
+        # method -> [(handler, is_coro, 无命名分组的正则, 参数名)]
+        self._dynamic_routes: Dict[str, List[Tuple[Callable, bool, str, Tuple[str, ...]]]] = {}
+        self._routers: Optional[Dict[str, Tuple[Callable, Dict[int, tuple]]]] = None  # 首次请求时由 _compile_router 生成
 
         # 模板系统
         self.jinja_env = Environment(
             loader=FileSystemLoader(template_folder),
             autoescape=True,
-            extensions=["jinja2.ext.loopcontrols"]
+            extensions=["jinja2.ext.loopcontrols"],
+            cache_size=400,
         )
+        # 非 DEBUG 模式下缓存模板对象，跳过 Jinja 的 auto_reload 检查
+        self._get_template = functools.lru_cache(maxsize=None)(self.jinja_env.get_template)
 
         # 配置系统
         # 在 MicroPy 中添加配置
-        self.config = {
+        self.config = _Config(self._sync_cookie_config, {
             "SECRET_KEY": secret_key,
             "SESSION_COOKIE_NAME": "micropy_session",
             "SESSION_COOKIE_SECURE": False,  # 生产环境设为 True
@@ -162,52 +438,160 @@ class MicroPy:
             "SESSION_EXPIRE_AT_BROWSER_CLOSE": True,
             "DEBUG": False,
             "TESTING": False,
-        }
+        })
+        # session cookie 相关配置的快照，响应时直接读属性，配置变更时同步
+        self._sync_cookie_config()
+
+        self._pyfile_cache: Dict[str, Tuple[int, Any]] = {}  # 文件名 -> (mtime_ns, 编译后的代码对象)
 
         # 中间件
         self.before_request_funcs = []
         self.after_request_funcs = []
         self.errorhandler_funcs = {}
+        # 异常类型 -> 沿 MRO 解析出的 errorhandler（没有则为 _MISSING）
+        self._eh_cache: "weakref.WeakKeyDictionary[type, Any]" = weakref.WeakKeyDictionary()
+
+        # 静态文件缓存：path -> (mtime_ns, st_size, content-type 头, content-length 值, 文件内容)，按 LRU 淘汰
+        self._static_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._static_cache_bytes = 0
+        # 正在读取中的静态文件：(path, mtime_ns, st_size) -> 线程池 future，同一文件的并发未命中共用一次读取
+        self._static_pending: Dict[Tuple[str, int, int], asyncio.Future] = {}
+        # 磁盘读取放到线程池里做，避免阻塞事件循环
+        self._io_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="micropy-io")
 
         # 全局上下文
         self._app_context = None
 
+    @property
+    def secret_key(self) -> str:
+        return self._secret_key
+
+    @secret_key.setter
+    def secret_key(self, value: str):
+        self._secret_key = value
+        self._secret_bytes = value.encode()
+
+    @property
+    def static_url_path(self) -> str:
+        return self._static_url_path
+
+    @static_url_path.setter
+    def static_url_path(self, value: str):
+        self._static_url_path = value
+        self._static_prefix = value.rstrip("/") + "/"
+
+    @property
+    def session_cookie_name(self) -> str:
+        return self._session_cookie_name
+
+    @session_cookie_name.setter
+    def session_cookie_name(self, value: str):
+        self._session_cookie_name = value
+        self._session_cookie_prefix = f"{value}=".encode()
+
+    def _sync_cookie_config(self):
+        """把 session cookie 相关配置复制到属性上，并拼好 "; Path=/; HttpOnly..." 部分"""
+        config = self.config
+        self._cookie_secure = config.get("SESSION_COOKIE_SECURE", False)
+        self._cookie_samesite = config.get("SESSION_COOKIE_SAMESITE")
+        self._cookie_permanent = config.get("SESSION_PERMANENT", False)
+        self._cookie_lifetime = config.get("PERMANENT_SESSION_LIFETIME", 31536000)
+
+        suffix = b"; Path=/; HttpOnly"
+        if self._cookie_secure:
+            suffix += b"; Secure"
+        if self._cookie_samesite:
+            suffix += f"; SameSite={self._cookie_samesite}".encode()
+        if self._cookie_permanent:
+            suffix += f"; Max-Age={self._cookie_lifetime}".encode()
+        self._cookie_suffix = suffix
+
     def config_from_object(self, obj):
         """从对象加载配置"""
-        for key in dir(obj):
-            if key.isupper():
-                self.config[key] = getattr(obj, key)
+        if isinstance(obj, ModuleType):
+            # 模块的命名空间就是全部属性，直接遍历，不用 dir() 排序
+            items = [(k, v) for k, v in vars(obj).items() if k.isupper()]
+        else:
+            # 类和实例要包含继承来的属性，仍然用 dir()
+            items = [(k, getattr(obj, k)) for k in dir(obj) if k.isupper()]
+        self.config.update(items)
 
     def config_from_pyfile(self, filename):
-        """从 Python 文件加载配置"""
-        with open(filename, "r") as f:
-            exec(f.read(), self.config)
+        """从 Python 文件加载配置（只取大写的键）"""
+        mtime_ns = os.stat(filename).st_mtime_ns
+        cached = self._pyfile_cache.get(filename)
+        if cached is not None and cached[0] == mtime_ns:
+            code = cached[1]
+        else:
+            # 文件改动后覆盖旧条目，每个文件只保留一份代码对象
+            with open(filename, "r") as f:
+                code = compile(f.read(), filename, "exec")
+            self._pyfile_cache[filename] = (mtime_ns, code)
+        namespace = {}
+        exec(code, namespace)
+        self.config.update({k: v for k, v in namespace.items() if k.isupper()})
 
     def config_from_envvar(self, var_name):
         """从环境变量加载配置"""
         value = os.getenv(var_name)
         if value:
-            self.config.update(json.loads(value))
+            self.config.update(_loads(value))
 
     def config_from_prefixed_env(self, prefix):
         """从前缀环境变量加载配置"""
-        for key, value in os.environ.items():
-            if key.startswith(prefix + "_"):
-                subkey = key[len(prefix) + 1:].lower()
-                self.config[subkey] = value
+        prefix = prefix + "_"
+        plen = len(prefix)
+        items = [(key[plen:].lower(), value) for key, value in os.environ.items() if key[:plen] == prefix]
+        self.config.update(items)
 
     def route(self, path: str, methods=("GET",)):
-        pattern_str = "^" + re.escape(path) + "$"
-        pattern_str = re.sub(r"\\{([^}/]+)\\}", r"(?P<\1>[^/]+)", pattern_str)
-        pattern = re.compile(pattern_str)
+        # body 是合并正则用的版本：参数为无名分组，避免不同路由的同名参数冲突
+        parts, pattern_str, body = _parse_path(path)
+        pattern = re.compile("^" + pattern_str + "$")
+        param_names = tuple(parts[1::2])
+        is_static = not param_names
+
+        url_template = _url_template(path, parts)
 
         def decorator(handler: Callable):
+            is_coro = asyncio.iscoroutinefunction(handler)  # 注册时判定一次，请求时不再检查
             for method in methods:
-                self.routes.append((pattern, method.upper(), handler))
-                self.route_map[f"{method.upper()}:{path}"] = path
+                method = method.upper()
+                # 与逐条匹配时一致：先注册的路由优先。已被更早的路由匹配的无参数路由永远不会被命中，不放进字典
+                shadowed = is_static and any(m == method and p.match(path) for p, m, _, _ in self.routes)
+                self.routes.append((pattern, method, handler, is_coro))
+                self.route_map[f"{method}:{path}"] = path
+                self._url_templates[f"{method}:{path}"] = url_template
+                # 无参数路由直接查字典
+                if is_static:
+                    if not shadowed:
+                        self._static_routes[(method, path)] = (handler, is_coro)
+                else:
+                    self._dynamic_routes.setdefault(method, []).append((handler, is_coro, body, param_names))
+                    self._routers = None
             return handler
         return decorator
 
+    def _compile_router(self) -> Dict[str, Tuple[Callable, Dict[int, tuple]]]:
+        """把每个方法的动态路由合并成一个交替正则 ^(?:(r0)|(r1)|...)$，一次 match 确定路由
+
+        每条路由外层包一个分组，match 后 m.lastindex 就是命中路由的外层分组编号，
+        用它查表得到 (handler, is_coro, 参数名, 分组编号)。
+        """
+        routers = {}
+        for method, entries in self._dynamic_routes.items():
+            alternatives = []
+            table = {}
+            group = 1
+            for handler, is_coro, body, param_names in entries:
+                alternatives.append(f"({body})")
+                table[group] = (handler, is_coro, param_names, group)
+                group += 1 + len(param_names)
+            combined = re.compile("^(?:" + "|".join(alternatives) + ")$")
+            routers[method] = (combined.match, table)
+        self._routers = routers
+        return routers
+
     def get(self, path: str):
         return self.route(path, methods=["GET"])
 
@@ -215,22 +599,25 @@ class MicroPy:
         return self.route(path, methods=["POST"])
 
     def url_for(self, endpoint: str, **values) -> str:
-        if endpoint in self.route_map:
-            path = self.route_map[endpoint]
-            for k, v in values.items():
-                path = path.replace(f"{{{k}}}", str(v))
-            return path
-        return "/"
+        url_template = self._url_templates.get(endpoint)
+        if url_template is None:
+            return "/"
+        return url_template(values)
 
     def render_template(self, filename: str, **context) -> str:
         try:
-            template = self.jinja_env.get_template(filename)
-            return template.render(**context)
+            return self._lookup_template(filename).render(**context)
         except TemplateNotFound:
             raise FileNotFoundError(f"Template {filename} not found.")
         except TemplateSyntaxError as e:
             raise RuntimeError(f"Template syntax error in {filename}: {e}")
 
+    def _lookup_template(self, filename: str):
+        """DEBUG 模式下每次交给 Jinja 检查文件更新，否则使用缓存的模板对象"""
+        if self.config["DEBUG"]:
+            return self.jinja_env.get_template(filename)
+        return self._get_template(filename)
+
     def before_request(self, func):
         self.before_request_funcs.append(func)
         return func
@@ -242,226 +629,265 @@ class MicroPy:
     def errorhandler(self, code_or_exception):
         def decorator(func):
             self.errorhandler_funcs[code_or_exception] = func
+            self._eh_cache.clear()
             return func
         return decorator
 
+    def _find_errorhandler(self, exc_type: type) -> Optional[Callable]:
+        """沿异常类型的 MRO 查找最近的 errorhandler，结果按类型缓存"""
+        handler = self._eh_cache.get(exc_type)
+        if handler is None:
+            handler = _MISSING
+            funcs = self.errorhandler_funcs
+            for cls in exc_type.__mro__:
+                if cls in funcs:
+                    handler = funcs[cls]
+                    break
+            self._eh_cache[exc_type] = handler
+        return None if handler is _MISSING else handler
+
     def abort(self, code: int):
         """主动抛出错误，触发 errorhandler"""
         raise RuntimeError(f"Abort with status code {code}")
 
     def clear_session(self, request):
         request.session.clear()
-        cookie_header = f"{self.session_cookie_name}=deleted; Path=/; Expires=Thu, 01 Jan 1970 00:00:00 GMT; HttpOnly"
-        request._response_headers.append((b"set-cookie", cookie_header.encode()))
+        request._response_headers.append((b"set-cookie", self._session_cookie_prefix + _DELETED_COOKIE))
 
-    def _build_headers_with_session(self, request, content_type: str = "text/html") -> List[Tuple[bytes, bytes]]:
-        headers = [
-            (b"content-type", content_type.encode()),
-        ]
+    def _build_headers_with_session(self, request, ct_header: Tuple[bytes, bytes], content_length: int) -> List[Tuple[bytes, bytes]]:
+        """响应头：content-type、content-length、handler 追加的头以及 session cookie"""
+        headers = [ct_header, (b"content-length", _content_length(content_length))]
 
-        if hasattr(request, "_response_headers"):
+        if request._response_headers:
             headers.extend(request._response_headers)
 
-        if hasattr(request, "session") and isinstance(request.session, dict) and request.session:
+        # 只有 session 被修改（或需要刷新永久 session 的有效期）时才重新签名下发
+        session = request.session
+        if session and (getattr(session, "modified", True) or self._cookie_permanent):
             try:
-                session_data = serialize_session(request.session, self.secret_key)
-                cookie_header = f"{self.session_cookie_name}={session_data}; Path=/; HttpOnly"
-                if self.config["SESSION_COOKIE_SECURE"]:
-                    cookie_header += "; Secure"
-                if self.config["SESSION_COOKIE_SAMESITE"]:
-                    cookie_header += f"; SameSite={self.config['SESSION_COOKIE_SAMESITE']}"
-                if self.config["SESSION_PERMANENT"]:
-                    cookie_header += f"; Max-Age={self.config.get('PERMANENT_SESSION_LIFETIME', 31536000)}"
-                headers.append((b"set-cookie", cookie_header.encode()))
+                session_data = serialize_session(session, self._secret_bytes)
+                headers.append((b"set-cookie", self._session_cookie_prefix + session_data + self._cookie_suffix))
             except Exception as e:
-                print(f"Session serialization failed: {e}")
+                log.warning("Session serialization failed: %s", e)
 
         return headers
 
+    async def _load_static(self, file_path: str, st: os.stat_result) -> Tuple[Tuple[bytes, bytes], bytes, bytes]:
+        """返回静态文件的 (content-type 头, content-length 值, 文件内容)；mtime 或大小变化时重新读取
+
+        只缓存不可变的 bytes / 元组，ASGI 消息由调用方每次新建，避免中间件改动消息时污染缓存。
+        """
+        cache = self._static_cache
+        entry = cache.get(file_path)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            cache.move_to_end(file_path)
+            return entry[2], entry[3], entry[4]
+
+        key = (file_path, st.st_mtime_ns, st.st_size)
+        fut = self._static_pending.get(key)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.run_in_executor(self._io_executor, _read_file, file_path)
+            self._static_pending[key] = fut
+            fut.add_done_callback(functools.partial(self._store_static, key))
+        # shield：某个请求被取消时不影响其他等待同一次读取的请求
+        data = await asyncio.shield(fut)
+        ct = _CT_MAP.get(file_path[file_path.rfind("."):], "application/octet-stream")
+        return _CT_HEADERS[ct], _content_length(len(data)), data
+
+    def _store_static(self, key: Tuple[str, int, int], fut: asyncio.Future):
+        """读取完成后在事件循环线程里写入缓存；按写入时真实存在的旧条目维护字节数"""
+        self._static_pending.pop(key, None)
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        file_path, mtime_ns, size = key
+        data = fut.result()
+        ct = _CT_MAP.get(file_path[file_path.rfind("."):], "application/octet-stream")
+
+        cache = self._static_cache
+        old = cache.pop(file_path, None)
+        if old is not None:
+            self._static_cache_bytes -= len(old[4])
+        cache[file_path] = (mtime_ns, size, _CT_HEADERS[ct], _content_length(len(data)), data)
+        self._static_cache_bytes += len(data)
+        while len(cache) > _STATIC_CACHE_MAX_ENTRIES or self._static_cache_bytes > _STATIC_CACHE_MAX_BYTES:
+            _, evicted = cache.popitem(last=False)
+            self._static_cache_bytes -= len(evicted[4])
+
+    async def _stream_file(self, send, file_path: str, ct: str, size: int):
+        """分块发送大文件，每块都在线程池中读取"""
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                _CT_HEADERS[ct],
+                (b"content-length", _content_length(size))
+            ],
+        })
+        loop = asyncio.get_running_loop()
+        remaining = size
+        with open(file_path, "rb") as f:
+            while True:
+                chunk = await loop.run_in_executor(self._io_executor, f.read, _STATIC_CHUNK_SIZE)
+                remaining -= len(chunk)
+                more_body = bool(chunk) and remaining > 0
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": more_body,
+                })
+                if not more_body:
+                    break
+
+    async def _finish(self, send, request, status: int, content_bytes: bytes, ct_header: Tuple[bytes, bytes]):
+        """发送带 session 头的完整响应"""
+        headers = self._build_headers_with_session(request, ct_header, len(content_bytes))
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": headers,
+        })
+        await send({
+            "type": "http.response.body",
+            "body": content_bytes,
+        })
+
     async def __call__(self, scope, receive, send):
         if scope["type"] != "http":
             return
-        request = Request(scope, receive)
+
+        # 忽略 favicon.ico：用预先构造好的头直接回 204
+        if scope["path"] == "/favicon.ico":
+            await send({
+                "type": "http.response.start",
+                "status": 204,
+                "headers": [_FAVICON_CT, _CL_ZERO],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        request = Request(scope, receive, self)
         method = request.method
         path = request.path
 
         # 解析 session —— 确保它总是 dict，永不为 None
         cookie = request.cookies.get(self.session_cookie_name)
-        session_data = deserialize_session(cookie, self.secret_key)
-        request.session = session_data if isinstance(session_data, dict) else {}
-        
-        # 忽略 favicon.ico
-        if path == "/favicon.ico":
-            await send_response(send, 204, "", "image/x-icon")
-            return
+        session_data = deserialize_session(cookie, self._secret_bytes)
+        if isinstance(session_data, dict) and session_data:
+            # 绕过 _TrackedDict.update，载入的数据不算修改
+            dict.update(request.session, session_data)
 
         # 静态文件
-        if path.startswith(self.static_url_path):
-            file_path = "." + path
-            if os.path.exists(file_path) and os.path.isfile(file_path):
-                ext = os.path.splitext(file_path)[1]
-                ct_map = {
-                    ".css": "text/css", ".js": "application/javascript",
-                    ".png": "image/png", ".jpg": "image/jpeg", ".ico": "image/x-icon",
-                    ".html": "text/html", ".json": "application/json"
-                }
-                ct = ct_map.get(ext, "application/octet-stream")
-                with open(file_path, "rb") as f:
-                    data = f.read()
+        # 只匹配整段前缀（/static/...，不含 /staticfoo），且路径里不能有 .. 段，避免越出静态目录
+        file_path = _static_file_path(path) if path.startswith(self._static_prefix) else None
+        if file_path is not None:
+            st = _stat_file(file_path)
+            if st is not None and st.st_size <= _STATIC_CACHE_MAX_FILE_SIZE:
+                # 小文件走内存缓存，每次用缓存的头和内容新建 ASGI 消息
+                ct_header, content_length, data = await self._load_static(file_path, st)
                 await send({
                     "type": "http.response.start",
                     "status": 200,
-                    "headers": [
-                        (b"content-type", ct.encode()),
-                        (b"content-length", str(len(data)).encode())
-                    ],
-                })
-                await send({
-                    "type": "http.response.body",
-                    "body": data,
+                    "headers": [ct_header, (b"content-length", content_length)],
                 })
+                await send({"type": "http.response.body", "body": data})
+                return
+            if st is not None:
+                ct = _CT_MAP.get(file_path[file_path.rfind("."):], "application/octet-stream")
+                if "http.response.pathsend" in scope.get("extensions", {}):
+                    # 服务器支持 pathsend 时由其直接 sendfile，文件不经过 Python
+                    await send({
+                        "type": "http.response.start",
+                        "status": 200,
+                        "headers": [
+                            _CT_HEADERS[ct],
+                            (b"content-length", _content_length(st.st_size))
+                        ],
+                    })
+                    await send({
+                        "type": "http.response.pathsend",
+                        "path": os.path.abspath(file_path),
+                    })
+                    return
+                await self._stream_file(send, file_path, ct, st.st_size)
                 return
 
-        # 路由匹配
+        # 路由匹配：先查静态路由表，再用合并后的动态路由正则匹配一次
         handler = None
-        for pattern, method_name, func in self.routes:
-            match = pattern.match(path)
-            if match and method_name == method:
-                handler = func
-                request.params = match.groupdict()
-                break
+        route = self._static_routes.get((method, path))
+        if route is not None:
+            handler, is_coro = route
+        else:
+            routers = self._routers
+            if routers is None:
+                routers = self._compile_router()
+            router = routers.get(method)
+            if router is not None:
+                match, table = router
+                m = match(path)
+                if m is not None:
+                    handler, is_coro, param_names, group = table[m.lastindex]
+                    # groups() 从第 1 组开始，外层分组 group 之后紧跟该路由的参数分组
+                    request.params = dict(zip(param_names, m.groups()[group:group + len(param_names)]))
 
         if not handler:
-            await send_response(send, 404, "<h1>404 The route does not exist.</h1>")
+            await send({
+                "type": "http.response.start",
+                "status": 404,
+                "headers": [_H_CT_HTML, _404_CL],
+            })
+            await send({"type": "http.response.body", "body": _404_BODY})
             return
 
-        # 执行 before_request
-        for func in self.before_request_funcs:
-            try:
-                result = func()
-                if result is not None:
-                    await send_json(send, result, 400)
+        # 执行 before_request（没有注册钩子时直接跳过）
+        if self.before_request_funcs:
+            for func in self.before_request_funcs:
+                try:
+                    result = func()
+                    if result is not None:
+                        await send_json(send, result, 400)
+                        return
+                except Exception as e:
+                    log.warning("Before request error: %s", e)
+                    await send_response(send, 500, f"Before request error: {e}")
                     return
-            except Exception as e:
-                print(f"Before request error: {e}")
-                await send_response(send, 500, f"Before request error: {e}")
-                return
 
         try:
             # 调用 handler
-            response = await handler(request) if asyncio.iscoroutinefunction(handler) else handler(request)
+            response = await handler(request) if is_coro else handler(request)
 
             # === 处理响应 ===
             if response is None or response == "":
                 # 自动渲染模板
                 auto_template = (path.strip("/") or "index") + ".html"
-                auto_path = os.path.join(self.template_folder, auto_template)
-                if os.path.exists(auto_path):
-                    with open(auto_path, "r", encoding="utf-8") as f:
-                        content = f.read()
-                    headers = self._build_headers_with_session(request, "text/html")
-                    content_bytes = content.encode("utf-8")
-                    headers.append((b"content-length", str(len(content_bytes)).encode()))
-                    await send({
-                        "type": "http.response.start",
-                        "status": 200,
-                        "headers": headers,
-                    })
-                    await send({
-                        "type": "http.response.body",
-                        "body": content_bytes,
-                    })
-                    return
-                else:
+                try:
+                    template = self._lookup_template(auto_template)
+                except TemplateNotFound:
                     await send_response(send, 404, "Template not found")
                     return
+                await self._finish(send, request, 200, template.render().encode("utf-8"), _H_CT_HTML)
+                return
 
             # === 处理返回值 ===
-            if isinstance(response, str):
-                # 返回字符串
-                content_bytes = response.encode("utf-8")
-                headers = self._build_headers_with_session(request, "text/html")
-                headers.append((b"content-length", str(len(content_bytes)).encode()))
-                await send({
-                    "type": "http.response.start",
-                    "status": 200,
-                    "headers": headers,
-                })
-                await send({
-                    "type": "http.response.body",
-                    "body": content_bytes,
-                })
-
-            elif isinstance(response, dict):
-                # 返回字典 → JSON
-                content = json.dumps(response, ensure_ascii=False)
-                headers = self._build_headers_with_session(request, "application/json")
-                content_bytes = content.encode("utf-8")
-                headers.append((b"content-length", str(len(content_bytes)).encode()))
-                await send({
-                    "type": "http.response.start",
-                    "status": 200,
-                    "headers": headers,
-                })
-                await send({
-                    "type": "http.response.body",
-                    "body": content_bytes,
-                })
-
-            elif isinstance(response, tuple):
-                # 返回 (str, int) 或 (dict, int)
-                if len(response) == 2:
-                    content, status = response
-                    if isinstance(content, str):
-                        content_bytes = content.encode("utf-8")
-                        headers = self._build_headers_with_session(request, "text/html")
-                        headers.append((b"content-length", str(len(content_bytes)).encode()))
-                        await send({
-                            "type": "http.response.start",
-                            "status": status,
-                            "headers": headers,
-                        })
-                        await send({
-                            "type": "http.response.body",
-                            "body": content_bytes,
-                        })
-                    elif isinstance(content, dict):
-                        content = json.dumps(content, ensure_ascii=False)
-                        headers = self._build_headers_with_session(request, "application/json")
-                        content_bytes = content.encode("utf-8")
-                        headers.append((b"content-length", str(len(content_bytes)).encode()))
-                        await send({
-                            "type": "http.response.start",
-                            "status": status,
-                            "headers": headers,
-                        })
-                        await send({
-                            "type": "http.response.body",
-                            "body": content_bytes,
-                        })
-                    else:
-                        # 如果 content 不是 str 或 dict，返回 500
-                        await send_response(send, 500, "Invalid response type")
-                else:
-                    # tuple 长度不为 2，返回 500
+            if isinstance(response, tuple):
+                # 返回 (str, int)、(dict, int) 或 (bytes, int)
+                if len(response) != 2:
                     await send_response(send, 500, "Invalid response tuple length")
-
+                elif isinstance(response[0], (str, dict, bytes)):
+                    await self._finish(send, request, response[1], *_encode_body(response[0]))
+                else:
+                    await send_response(send, 500, "Invalid response type")
             else:
-                # 其他类型，如 Response 对象
-                await send_response(send, 200, str(response), "text/html")
+                # str → HTML，dict → JSON，bytes 原样发送，其他类型转为字符串
+                await self._finish(send, request, 200, *_encode_body(response))
 
         except Exception as e:
-            # 打印错误堆栈
-            print("\n" + "="*60)
-            print("❌ INTERNAL SERVER ERROR")
-            print(f"Path: {path}")
-            print(f"Method: {method}")
-            traceback.print_exc()
-            print("="*60 + "\n")
+            # 记录错误堆栈（由 logging 级别决定是否输出）
+            log.exception("500 %s %s", method, path)
 
             # 检查 errorhandler
-            error_handler = self.errorhandler_funcs.get(type(e), self.errorhandler_funcs.get(Exception))
-            if error_handler:
+            error_handler = self._find_errorhandler(type(e))
+            if error_handler is not None:
                 try:
                     result = error_handler(e)
                     if isinstance(result, str):
@@ -473,27 +899,35 @@ class MicroPy:
                     else:
                         await send_response(send, 500, "Internal Server Error")
                 except Exception as e2:
-                    print(f"Error in errorhandler: {e2}")
+                    log.exception("Error in errorhandler: %s", e2)
                     await send_response(send, 500, "Internal Server Error")
             else:
-                await send_response(send, 500, f"<h1>500 Internal Server Error</h1><pre>{str(e)}</pre>")
-
-        # 执行 after_request
-        for func in self.after_request_funcs:
-            try:
-                result = func()
-                if result is not None:
-                    # 处理返回值
-                    pass
-            except Exception as e:
-                print(f"After request error: {e}")
+                await send_response(send, 500, _500_HEAD + str(e).encode("utf-8") + _500_TAIL)
 
-    def run(self, host="127.0.0.1", port=8000):
+        # 执行 after_request（没有注册钩子时直接跳过）
+        if self.after_request_funcs:
+            for func in self.after_request_funcs:
+                try:
+                    result = func()
+                    if result is not None:
+                        # 处理返回值
+                        pass
+                except Exception as e:
+                    log.warning("After request error: %s", e)
+
+    def run(self, host="127.0.0.1", port=8000, access_log=False):
         try:
             import uvicorn
         except ImportError:
             raise ImportError("Uvicorn is required. Install with: pip install uvicorn")
-        uvicorn.run(self, host=host, port=port, log_level="info")
+        from importlib.util import find_spec
+        # 安装了 uvloop / httptools（pip install "uvicorn[standard]"）时使用 C 实现的事件循环和 HTTP 解析器
+        uvicorn.run(
+            self, host=host, port=port, log_level="info",
+            loop="uvloop" if find_spec("uvloop") else "asyncio",
+            http="httptools" if find_spec("httptools") else "h11",
+            access_log=access_log,
+        )
 
 # ======================
 # 全局变量（Flask 风格）